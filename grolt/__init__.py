@@ -19,17 +19,18 @@
 from __future__ import division
 
 from collections import namedtuple
-from inspect import getmembers
+from copy import copy
 from logging import getLogger
 from math import ceil
 from os import makedirs
 from os.path import isdir, join as path_join
 from random import choice
+import re
 from shlex import split as shlex_split
+import sys
 from threading import Thread
 from time import sleep
 from xml.etree import ElementTree
-from webbrowser import open as open_browser
 
 import click
 from click import BadParameter, ClickException
@@ -39,6 +40,7 @@ from monotonic import monotonic
 from py2neo import ServiceProfile, ConnectionProfile, ConnectionUnavailable
 from py2neo.addressing import Address
 from py2neo.client import Connector, Connection
+from py2neo.errors import ConnectionBroken, ConnectionLimit, ServiceUnavailable
 from packaging.version import InvalidVersion
 
 from six.moves import input
@@ -53,6 +55,68 @@ log = getLogger(__name__)
 
 debug_opts_type = namedtuple("debug_opts_type", ["suspend", "port"])
 
+_LS_ROW_FMT = "{:<12}{:<12}{:<15}{:<12}{:<12}{}".format
+
+# ANSI escape sequences used to render the console prompt. These match
+# the output of click.style(..., fg="green") and click.style(...).
+_PROMPT_GREEN = "\x1b[32m"
+_PROMPT_RESET = "\x1b[0m"
+
+_CORE_MODES = frozenset({"c", "core"})
+_REPLICA_MODES = frozenset({"r", "rr", "replica", "read-replica", "read_replica"})
+
+# Only the characters that shlex treats as whitespace separate arguments.
+_SHLEX_WHITESPACE = " \t\r\n"
+_SPACE_RE = re.compile(r"[ \t\r\n]+")
+_TOKEN_RE = re.compile(r"""[ \t\r\n]*(?:"([^"\\]*)"|'([^']*)'|([^ \t\r\n"'\\]+))(?=[ \t\r\n]|$)""")
+
+
+def _split_args(text):
+    """ Split a line of console input into arguments, as per shlex. Bare
+    words and wholly quoted words are handled directly; anything more
+    complex, such as escapes or partially quoted words, falls back to
+    shlex itself.
+    """
+    if '"' not in text and "'" not in text and "\\" not in text:
+        text = text.strip(_SHLEX_WHITESPACE)
+        return _SPACE_RE.split(text) if text else []
+    args = []
+    pos, end = 0, len(text.rstrip(_SHLEX_WHITESPACE))
+    while pos < end:
+        match = _TOKEN_RE.match(text, pos)
+        if match is None:
+            return shlex_split(text)
+        double_quoted, single_quoted, bare = match.groups()
+        if double_quoted is not None:
+            args.append(double_quoted)
+        elif single_quoted is not None:
+            args.append(single_quoted)
+        else:
+            args.append(bare)
+        pos = match.end()
+    return args
+
+
+_READLINE = None
+
+
+def _ensure_readline():
+    """ Import readline on first use of the interactive console. This
+    allows for extended input functionality, including up/down arrow
+    navigation, without paying the import cost on every startup.
+    """
+    global _READLINE
+    if _READLINE is None:
+        try:
+            import readline
+        except ImportError:
+            # readline is not available for windows 10
+            # noinspection PyUnresolvedReferences
+            from pyreadline import Readline
+            readline = Readline()
+        _READLINE = readline
+    return _READLINE
+
 
 def port_range(base_port, count):
     if base_port:
@@ -444,6 +508,9 @@ class Neo4jService(object):
             raise ValueError("Auth user must be 'neo4j' or empty")
         self.user = user
         self.machines = {}
+        # Incremented whenever the set of machines changes, so that
+        # consumers can tell when cached lookups need to be rebuilt.
+        self.machines_revision = 0
         self.network = None
         self.console = None
 
@@ -463,6 +530,7 @@ class Neo4jService(object):
         for spec, machine in self.machines.items():
             if machine is None:
                 self.machines[spec] = Neo4jMachine(spec, self.image, self.auth, self.user)
+        self.machines_revision += 1
 
     def routers(self):
         return list(self.machines.values())
@@ -663,6 +731,7 @@ class Neo4jClusterService(Neo4jService):
                         ",".join(discovery_addresses),
                 })
                 self.machines[spec] = Neo4jMachine(spec, self.image, self.auth, self.user)
+        self.machines_revision += 1
 
     def cores(self):
         return [machine for spec, machine in self.machines.items()
@@ -708,6 +777,7 @@ class Neo4jClusterService(Neo4jService):
     def _remove_machine(self, spec):
         machine = self.machines[spec]
         del self.machines[spec]
+        self.machines_revision += 1
         machine.stop()
         if spec.dbms_mode == "CORE":
             self.free_core_machine_specs.append(spec)
@@ -738,63 +808,158 @@ class Neo4jConsole(object):
 
     args = None
 
+    interactive = True
+
+    # Short help text for each command, keyed by (command, width).
+    _short_help_cache = {}
+
     def __init__(self, service):
         self.service = service
+        self._machine_index = {}
+        self._machine_index_revision = None
+        self._contexts = {}
+        self._rt_connector = None
+        self._rt_profile = None
+        self._prompt_text = "".join([
+            _PROMPT_GREEN, self.service.name, _PROMPT_RESET,
+            ">", _PROMPT_RESET,
+        ])
+
+    @classmethod
+    def _commands(cls):
+        """ Return a dictionary of all console commands available on this
+        class, keyed by name. This is built once per class and cached.
+        """
+        if "__commands__" not in cls.__dict__:
+            cls.__commands__ = {name: value
+                                for klass in reversed(cls.__mro__)
+                                for name, value in vars(klass).items()
+                                if isinstance(value, click.Command)}
+        return cls.__commands__
 
     def __iter__(self):
-        for name, value in getmembers(self):
-            if isinstance(value, click.Command):
-                yield name
+        return iter(self._commands())
 
     def __getitem__(self, name):
-        try:
-            f = getattr(self, name)
-        except AttributeError:
+        f = self._commands().get(name)
+        if f is None:
             raise BadParameter('No such command "%s".' % name)
-        else:
-            if isinstance(f, click.Command):
-                return f
-            else:
-                raise BadParameter('No such command "%s".' % name)
+        return f
 
-    def _iter_machines(self, name):
-        if not name:
-            name = "a"
-        for spec in list(self.service.machines):
-            if name in (spec.name, spec.fq_name):
-                yield self.service.machines[spec]
+    def _index(self):
+        """ Return a dictionary mapping both short and fully-qualified
+        machine names to machines. This is rebuilt only when the set of
+        machines within the service has changed.
+        """
+        service = self.service
+        revision = service.machines_revision
+        if self._machine_index_revision != revision:
+            index = {}
+            for spec, machine in service.machines.items():
+                index[spec.name] = machine
+                index[spec.fq_name] = machine
+            self._machine_index = index
+            self._machine_index_revision = revision
+        return self._machine_index
+
+    def _get_machine(self, name):
+        """ Return the machine with a given short or fully-qualified name,
+        or None if no such machine exists. If no name is given, 'a' is used.
+        """
+        return self._index().get(name or "a")
 
     def _for_each_machine(self, name, f):
-        found = 0
-        for machine_obj in self._iter_machines(name):
-            f(machine_obj)
-            found += 1
-        return found
+        """ Apply a function to each matching machine and return the number
+        of machines matched. The name '*' matches every machine in the
+        service; when several machines match, each runs in its own thread.
+        """
+        if name == "*":
+            machines = [machine for machine in self.service.machines.values()
+                        if machine is not None]
+        else:
+            machine = self._get_machine(name)
+            machines = [] if machine is None else [machine]
+        if len(machines) == 1:
+            f(machines[0])
+        else:
+            # Errors raised in worker threads are collected and the first
+            # is re-raised, so failures surface as in the single case.
+            errors = []
+
+            def apply(m):
+                try:
+                    f(m)
+                except Exception as error:
+                    errors.append(error)
+
+            threads = []
+            for machine in machines:
+                thread = Thread(target=apply, args=(machine,))
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+        return len(machines)
 
     def prompt(self):
         # We don't use click.prompt functionality here as that doesn't play
         # nicely with readline. Instead, we use click.echo for the main prompt
         # text and a raw input call to read from stdin.
-        text = "".join([
-            click.style(self.service.name, fg="green"),
-            click.style(">"),
-        ])
         prompt_suffix = " "
-        click.echo(text, nl=False)
-        return input(prompt_suffix)
+        click.echo(self._prompt_text, nl=False)
+        if self.interactive:
+            return input(prompt_suffix)
+        # When commands are piped in from a script, readline is bypassed
+        # and whole lines are read from the buffered stdin stream instead.
+        click.echo(prompt_suffix, nl=False)
+        line = sys.stdin.readline()
+        if not line:
+            raise EOFError()
+        return line.rstrip("\r\n")
 
     def run(self):
-        while True:
-            text = self.prompt()
-            if text:
-                self.args = shlex_split(text)
-                self.invoke(*self.args)
+        self.interactive = sys.stdin.isatty()
+        if self.interactive:
+            _ensure_readline()
+        try:
+            while True:
+                text = self.prompt()
+                if text:
+                    self.args = _split_args(text)
+                    self.invoke(*self.args)
+        finally:
+            self._close_rt_connector()
+
+    def _close_rt_connector(self):
+        if self._rt_connector is not None:
+            self._rt_connector.close()
+        self._rt_connector = None
+        self._rt_profile = None
+
+    def _make_context(self, arg0, f, args):
+        """ Create a context for invoking a command. A command without
+        parameters always produces an identical context, so this is made
+        once and then copied for each subsequent invocation.
+        """
+        if args or f.params:
+            return f.make_context(arg0, args, obj=self)
+        try:
+            ctx = self._contexts[arg0]
+        except KeyError:
+            ctx = self._contexts[arg0] = f.make_context(arg0, args, obj=self)
+        return copy(ctx)
 
     def invoke(self, *args):
         try:
-            arg0, args = args[0], list(args[1:])
+            # Click's parser consumes its argument list in place, so
+            # this needs to be a fresh list rather than a tuple slice.
+            args = list(args)
+            arg0 = args.pop(0)
             f = self[arg0]
-            ctx = f.make_context(arg0, args, obj=self)
+            ctx = self._make_context(arg0, f, args)
             return f.invoke(ctx)
         except click.exceptions.Exit:
             pass
@@ -811,15 +976,15 @@ class Neo4jConsole(object):
         which the browser should be tied. If no machine name is given, 'a' is
         assumed.
         """
+        from webbrowser import open as open_browser
 
-        def f(m):
-            http_uri = m.uri("http")
-            click.echo("Opening web browser for machine {!r} at "
-                       "«{}»".format(m.spec.fq_name, http_uri))
-            open_browser(http_uri)
-
-        if not self._for_each_machine(machine, f):
+        m = self._get_machine(machine)
+        if m is None:
             raise BadParameter("Machine {!r} not found".format(machine))
+        http_uri = m.uri("http")
+        click.echo("Opening web browser for machine {!r} at "
+                   "«{}»".format(m.spec.fq_name, http_uri))
+        open_browser(http_uri)
 
     @click.command()
     @click.pass_obj
@@ -833,8 +998,9 @@ class Neo4jConsole(object):
           NEO4J_AUTH         colon-separated user and password
 
         """
-        for key, value in sorted(self.service.env().items()):
-            click.echo("%s=%r" % (key, value))
+        env = self.service.env()
+        lines = ["%s=%r" % (key, env[key]) for key in sorted(env)]
+        sys.stdout.write("\n".join(lines) + "\n")
 
     @click.command()
     @click.pass_obj
@@ -850,26 +1016,24 @@ class Neo4jConsole(object):
         """ Get help on a command or show all available commands.
         """
         if command:
-            try:
-                f = self[command]
-            except KeyError:
-                raise BadParameter('No such command "%s".' % command)
-            else:
-                ctx = self.help.make_context(command, [], obj=self)
-                click.echo(f.get_help(ctx))
+            f = self[command]
+            ctx = self.help.make_context(command, [], obj=self)
+            click.echo(f.get_help(ctx))
         else:
-            click.echo("Commands:")
-            command_width = max(map(len, self))
+            commands = self._commands()
+            names = sorted(commands)
+            command_width = max(map(len, names))
             text_width = 73 - command_width
-            template = "  {:<%d}   {}" % command_width
-            for arg0 in sorted(self):
-                f = self[arg0]
-                text = [f.get_short_help_str(limit=text_width)]
-                for i, line in enumerate(text):
-                    if i == 0:
-                        click.echo(template.format(arg0, line))
-                    else:
-                        click.echo(template.format("", line))
+            template = ("  {:<%d}   {}" % command_width).format
+            lines = ["Commands:"]
+            for name in names:
+                f = commands[name]
+                key = (f, text_width)
+                text = self._short_help_cache.get(key)
+                if text is None:
+                    text = self._short_help_cache[key] = f.get_short_help_str(limit=text_width)
+                lines.append(template(name, text))
+            sys.stdout.write("\n".join(lines) + "\n")
 
     @click.command()
     @click.pass_obj
@@ -889,12 +1053,13 @@ class Neo4jConsole(object):
         - Debug port
 
         """
-        click.echo("NAME        CONTAINER   MODE           "
-                   "BOLT PORT   HTTP PORT   DEBUG PORT")
-        for spec, machine in self.service.machines.items():
+        rows = ["NAME        CONTAINER   MODE           "
+                "BOLT PORT   HTTP PORT   DEBUG PORT"]
+        machines = self.service.machines
+        for spec, machine in machines.items():
             if spec is None or machine is None:
                 continue
-            click.echo("{:<12}{:<12}{:<15}{:<12}{:<12}{}".format(
+            rows.append(_LS_ROW_FMT(
                 spec.fq_name,
                 machine.container.short_id,
                 spec.config.get("dbms.mode", "SINGLE"),
@@ -902,13 +1067,14 @@ class Neo4jConsole(object):
                 spec.http_port or "-",
                 spec.debug_opts.port or "-",
             ))
+        sys.stdout.write("\n".join(rows) + "\n")
 
     @click.command()
     @click.argument("machine", required=False)
     @click.pass_obj
     def ping(self, machine):
         """ Ping a server by name to check it is available. If no server name
-        is provided, 'a' is used as a default.
+        is provided, 'a' is used as a default. Use '*' to ping all servers.
         """
 
         def f(m):
@@ -924,17 +1090,29 @@ class Neo4jConsole(object):
         """ Display the routing table for a given graph database.
         """
         routers = self.service.routers()
-        cx = Connector(ServiceProfile(routers[0].profiles["bolt"], routing=True))
+        profile = routers[0].profiles["bolt"]
         if gdb is None:
             click.echo("Refreshing routing information for the default graph database...")
         else:
             click.echo("Refreshing routing information for graph database %r..." % gdb)
-        rt = cx.refresh_routing_table(gdb)
+        try:
+            if self._rt_connector is None or self._rt_profile != profile:
+                # The connector is kept open between calls, and only
+                # replaced when the first router changes or a refresh fails.
+                self._close_rt_connector()
+                self._rt_connector = Connector(ServiceProfile(profile, routing=True))
+                self._rt_profile = profile
+            cx = self._rt_connector
+            rt = cx.refresh_routing_table(gdb)
+        except (ConnectionUnavailable, ConnectionBroken, ConnectionLimit,
+                ServiceUnavailable) as error:
+            self._close_rt_connector()
+            raise ClickException("Could not refresh routing information: %s" %
+                                 " ".join(map(str, error.args)))
         ro_profiles, rw_profiles, _ = rt.runners()
         click.echo("Routers: %s" % " ".join(map(str, cx.get_router_profiles())))
         click.echo("Readers: %s" % " ".join(map(str, ro_profiles)))
         click.echo("Writers: %s" % " ".join(map(str, rw_profiles)))
-        cx.close()
 
     @click.command()
     @click.argument("machine", required=False)
@@ -944,12 +1122,19 @@ class Neo4jConsole(object):
 
         If no server name is provided, 'a' is used as a default.
         """
-
-        def f(m):
-            click.echo(m.container.logs())
-
-        if not self._for_each_machine(machine, f):
+        m = self._get_machine(machine)
+        if m is None:
             raise BadParameter("Machine {!r} not found".format(machine))
+        # Logs can be large, so they are streamed through to stdout in
+        # chunks rather than being loaded into memory in one go.
+        sys.stdout.flush()
+        out = click.get_binary_stream("stdout")
+        chunk = b""
+        for chunk in m.container.logs(stream=True, follow=False):
+            out.write(chunk)
+        if not chunk.endswith(b"\n"):
+            out.write(b"\n")
+        out.flush()
 
     @click.command()
     @click.argument("time", type=float)
@@ -958,7 +1143,8 @@ class Neo4jConsole(object):
     def pause(self, time, machine):
         """ Pause a server for a given number of seconds.
 
-        If no server name is provided, 'a' is used as a default.
+        If no server name is provided, 'a' is used as a default. Use '*' to
+        pause all servers at once.
         """
 
         def f(m):
@@ -988,9 +1174,9 @@ class Neo4jClusterConsole(Neo4jConsole):
         - r, rr, replica, read-replica, read_replica
 
         """
-        if mode in ("c", "core"):
+        if mode in _CORE_MODES:
             self.service.add_core()
-        elif mode in ("r", "rr", "replica", "read-replica", "read_replica"):
+        elif mode in _REPLICA_MODES:
             self.service.add_replica()
         else:
             raise BadParameter('Invalid value for "MODE", choose from '
@@ -28,16 +28,6 @@ from grolt import make_auth, Neo4jService, Neo4jDirectorySpec, __name__ as root_
 from grolt.compat import shlex_quote
 from grolt.security import install_self_signed_certificate
 
-# The readline import allows for extended input functionality, including
-# up/down arrow navigation. This should not be removed.
-try:
-    import readline
-except ModuleNotFoundError as e:
-    # readline is not available for windows 10
-    # noinspection PyUnresolvedReferences
-    from pyreadline import Readline
-    readline = Readline()
-
 
 class AuthParamType(ParamType):
 